@@ -9,6 +9,15 @@ from .core import (
     task,
     task_namespace
 )
+from .metrics import (
+    MetricSink,
+    StatsdSink,
+    PrometheusTextfileSink,
+    OpenMetricsTextfileSink,
+    add_metric_sink,
+    remove_metric_sink,
+    flush_metric_sinks,
+)
 
 __version__ = "0.1.0"
 __author__ = "Fred McDavid"
@@ -17,4 +26,11 @@ __email__ = "fred@frameworklabs.us"
 __all__ = [
     "task",
     "task_namespace",
+    "MetricSink",
+    "StatsdSink",
+    "PrometheusTextfileSink",
+    "OpenMetricsTextfileSink",
+    "add_metric_sink",
+    "remove_metric_sink",
+    "flush_metric_sinks",
 ]
\ No newline at end of file
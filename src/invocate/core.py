@@ -1,12 +1,19 @@
 """Core functionality for Invocate task management."""
 
 import contextlib
+import inspect
 import os
-from typing import Callable, Optional, Union, List, Tuple, Literal, Dict
+import time
+import types
+from typing import (
+    Any, Callable, Dict, Iterable, List, Literal, Optional, Tuple, Union)
 
 import attrs
 import invoke
 from invoke import Collection
+from invoke.parser import Argument
+
+from .metrics import emit_increment, emit_timing, has_metric_sinks, timed
 
 _task_collector = None
 _namespace_tree = None
@@ -20,6 +27,94 @@ class InvocateTask:
     name: str
 
 
+class _InvocateInvokeTask(invoke.Task):
+    """
+    An invoke task that caches its introspected signature and argument specs
+    and reports its start and end to any metric sinks.
+    """
+    _argspec: Optional[inspect.Signature] = None
+    _argument_specs: Optional[List[Dict[str, Any]]] = None
+    _positional: Optional[Iterable[str]] = None
+
+    @property
+    def positional(self) -> Iterable[str]:
+        # implicit positionals need the signature, so they are only worked
+        # out once the task's arguments are actually wanted
+        if self._positional is None:
+            self._positional = super().fill_implicit_positionals(None)
+        return self._positional
+
+    @positional.setter
+    def positional(self, value: Optional[Iterable[str]]) -> None:
+        self._positional = value
+
+    def fill_implicit_positionals(
+            self, positional: Optional[Iterable[str]]
+    ) -> Optional[Iterable[str]]:
+        # called at decoration time: keep invoke's check for a missing
+        # context argument, without introspecting the full signature
+        if isinstance(self.body, types.FunctionType):
+            code = self.body.__code__
+            if not (code.co_argcount or code.co_kwonlyargcount
+                    or code.co_flags & (
+                        inspect.CO_VARARGS | inspect.CO_VARKEYWORDS)):
+                raise TypeError(
+                    "Tasks must have an initial Context argument!")
+        else:
+            self.argspec(self.body)
+        return positional
+
+    def argspec(self, body: Callable) -> inspect.Signature:
+        if body is not self.body:
+            return super().argspec(body)
+        if self._argspec is None:
+            self._argspec = super().argspec(body)
+        return self._argspec
+
+    def get_arguments(
+            self, ignore_unknown_help: Optional[bool] = None
+    ) -> List[Argument]:
+        # invoke pops consumed entries off self.help while building the
+        # arguments, so they are built once and copied from then on
+        if self._argument_specs is None:
+            self._argument_specs = [
+                _argument_spec(arg)
+                for arg in super().get_arguments(ignore_unknown_help=True)]
+        if self.help and not ignore_unknown_help:
+            raise ValueError(
+                "Help field was set for param(s) that don't exist: {}".format(
+                    list(self.help.keys())))
+        return [Argument(**spec) for spec in self._argument_specs]
+
+    def __call__(self, *args, **kwargs):
+        if not has_metric_sinks():
+            return super().__call__(*args, **kwargs)
+        emit_increment('task.started', task=self.name)
+        start = time.perf_counter()
+        status = 'error'
+        try:
+            result = super().__call__(*args, **kwargs)
+            status = 'ok'
+            return result
+        finally:
+            emit_timing(
+                'task.finished', time.perf_counter() - start,
+                task=self.name, status=status)
+
+
+def _argument_spec(argument: Argument) -> Dict[str, Any]:
+    return dict(
+        names=argument.names,
+        kind=argument.kind,
+        default=argument.default,
+        help=argument.help,
+        positional=argument.positional,
+        optional=argument.optional,
+        incrementable=argument.incrementable,
+        attr_name=argument.attr_name,
+    )
+
+
 @attrs.define
 class TaskNamespace:
     """
@@ -81,6 +176,12 @@ class TaskNamespace:
     def _as_collection(self):
         if self.collection:
             return self.collection
+        if not has_metric_sinks():
+            return self._build_collection()
+        with timed('namespace.built', namespace=self._dotted_name()):
+            return self._build_collection()
+
+    def _build_collection(self):
         self.collection = Collection(self.name) if self.name else Collection()
         if self.children:
             for child in self.children:
@@ -90,6 +191,14 @@ class TaskNamespace:
                 self.collection.add_task(task.task, name=task.name)
         return self.collection
 
+    def _dotted_name(self) -> str:
+        names = []
+        cursor = self
+        while cursor and cursor.name:
+            names.insert(0, cursor.name)
+            cursor = cursor.parent
+        return '.'.join(names)
+
     def _add_child_namespace(self, namespace_name) -> 'TaskNamespace':
         if not self.children:
             self.children = []
@@ -161,6 +270,7 @@ class _InvocateTaskDecorator:
                 raise TypeError(
                     f"Invalid namespace type: {type(kwargs['namespace'])}")
             del kwargs['namespace']
+        kwargs.setdefault('klass', _InvocateInvokeTask)
 
         self.args = args
         self.kwargs = kwargs
@@ -169,6 +279,14 @@ class _InvocateTaskDecorator:
         return self._collect(func)
 
     def _collect(self, func):
+        if not has_metric_sinks():
+            return self._register(func)
+        namespace = '' if self.namespace == NO_COLLECTION_DEFINED \
+            else '.'.join(self.namespace)
+        with timed('task.registered', namespace=namespace):
+            return self._register(func)
+
+    def _register(self, func):
         wrapped_func = invoke.tasks.task(func, **self.kwargs)
         name = self.kwargs.get(
             'name') if 'name' in self.kwargs else func.__name__
@@ -195,12 +313,7 @@ def task(*args, **kwargs):
             pass
     """
     if args:
-        func = args[0]
-        wrapped_func = invoke.tasks.task(func)
-        name = func.__name__
-        task = InvocateTask(task=wrapped_func, name=name)
-        InvocateTaskCollector.singleton().add(NO_COLLECTION_DEFINED, task)
-        return wrapped_func
+        return _InvocateTaskDecorator()(args[0])
     else:
         return _InvocateTaskDecorator(**kwargs)
 
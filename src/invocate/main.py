@@ -3,18 +3,112 @@ Invoke's own 'binary' entrypoint.
 
 Dogfoods the `program` module.
 """
+import time
 from types import ModuleType
-from typing import Optional, Dict, Any
+from typing import Optional, Dict, Any, List, Iterable
 
 from invoke import (
     __version__, Program, Collection, Task, CollectionNotFound,
-    Exit)
+    Exit, Config, Failure, Local, Result)
 from invoke.config import copy_dict, merge_dicts
+from invoke.parser import Parser, ParserContext
+from invoke.util import Lexicon
 
 from .core import task_namespace
+from .metrics import (
+    emit_increment, emit_timing, flush_metric_sinks, has_metric_sinks)
+
+
+class InvocateLocal(Local):
+    """A local runner reporting ``c.run`` spawns and exits to metric sinks."""
+    _spawned_at: Optional[float] = None
+
+    def run(self, command: str, **kwargs: Any) -> Optional[Result]:
+        if has_metric_sinks():
+            emit_increment('run.spawned')
+            self._spawned_at = time.perf_counter()
+        return super().run(command, **kwargs)
+
+    def _finish(self) -> Result:
+        # both the synchronous path and Promise.join() end up here, so the
+        # exit is reported once the subprocess has actually finished
+        if self._spawned_at is None:
+            return super()._finish()
+        exit_code = None
+        try:
+            result = super()._finish()
+            exit_code = result.exited
+            return result
+        except Failure as e:
+            exit_code = e.result.exited
+            raise
+        finally:
+            emit_timing(
+                'run.exited', time.perf_counter() - self._spawned_at,
+                exit_code=str(exit_code))
+
+
+class InvocateConfig(Config):
+    """Invoke config whose default local runner is `InvocateLocal`."""
+
+    @staticmethod
+    def global_defaults() -> Dict[str, Any]:
+        defaults = Config.global_defaults()
+        defaults['runners']['local'] = InvocateLocal
+        return defaults
 
 
 class InvocateCollection(Collection):
+    def _transform_lexicon(self, old: Lexicon) -> Lexicon:
+        """
+        Take a Lexicon and apply `.transform` to its keys and aliases.
+
+        Unlike `.Collection._transform_lexicon`, values are adopted as-is
+        rather than deep-copied: the namespace tree handed to `from_module`
+        was just built by `task_namespace`, and copying it would touch every
+        registered task on every run.
+        """
+        new = Lexicon()
+        for key, value in old.items():
+            new[self.transform(key)] = value
+        for key, value in old.aliases.items():
+            new.alias(from_=self.transform(key), to=self.transform(value))
+        return new
+
+    def to_contexts_for(
+        self,
+        names: Iterable[str],
+        ignore_unknown_help: Optional[bool] = None,
+    ) -> List[ParserContext]:
+        """
+        Return parser contexts for only those tasks invoked as ``names``.
+
+        Unlike `.Collection.to_contexts`, tasks that are not named are never
+        introspected, so the cost does not grow with the size of the
+        collection. Names that are not tasks (flags, values, typos) are
+        ignored; the parser reports them as usual.
+        """
+        # rebuilt on every call: task_names is plain string work, and the
+        # tree (or any subcollection) may have changed since the last call
+        task_name_index = {}
+        for primary, aliases in self.task_names.items():
+            for name in [primary] + aliases:
+                task_name_index[name] = (primary, aliases)
+        contexts: Dict[str, ParserContext] = {}
+        for name in names:
+            if name not in task_name_index:
+                continue
+            primary, aliases = task_name_index[name]
+            if primary not in contexts:
+                contexts[primary] = ParserContext(
+                    name=primary,
+                    aliases=aliases,
+                    args=self[primary].get_arguments(
+                        ignore_unknown_help=ignore_unknown_help
+                    ),
+                )
+        return list(contexts.values())
+
     @classmethod
     def from_module(
         cls,
@@ -95,6 +189,29 @@ class InvocateCollection(Collection):
 
 
 class InvocateProgram(Program):
+    def run(self, argv: Optional[List[str]] = None, exit: bool = True) -> None:
+        try:
+            super().run(argv=argv, exit=exit)
+        finally:
+            flush_metric_sinks()
+
+    def _make_parser(self) -> Parser:
+        # completion needs every task; otherwise only build contexts for the
+        # tasks actually named on the command line (or given to --help)
+        if (self.args.complete.value
+                or not isinstance(self.collection, InvocateCollection)):
+            return super()._make_parser()
+        names = list(self.core.unparsed)
+        if isinstance(self.args.help.value, str):
+            names.append(self.args.help.value)
+        return Parser(
+            initial=self.initial_context,
+            contexts=self.collection.to_contexts_for(
+                names,
+                ignore_unknown_help=self.config.tasks.ignore_unknown_help,
+            ),
+        )
+
     def load_collection(self) -> None:
         """
         Load a task collection based on parsed core args, or die trying.
@@ -108,6 +225,7 @@ class InvocateProgram(Program):
             config=self.config, start=start
         )
         coll_name = self.args.collection.value
+        start_time = time.perf_counter()
         try:
             module, parent = loader.load(coll_name)
             # This is the earliest we can load project config, so we should -
@@ -122,6 +240,11 @@ class InvocateProgram(Program):
                 loaded_from=parent,
                 auto_dash_names=self.config.tasks.auto_dash_names,
             )
+            # sinks are usually attached by the tasks module itself, so the
+            # clock starts before it is imported and is reported afterwards
+            if has_metric_sinks():
+                emit_timing(
+                    'collection.loaded', time.perf_counter() - start_time)
         except CollectionNotFound as e:
             raise Exit("Can't find any collection named {!r}!".format(e.name))
 
@@ -131,4 +254,5 @@ program = InvocateProgram(
     binary="invocate",
     binary_names=["invocate"],
     version=__version__,
+    config_class=InvocateConfig,
 )
\ No newline at end of file
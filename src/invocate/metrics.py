@@ -0,0 +1,311 @@
+"""Instrumentation hooks and pluggable metric sinks for Invocate."""
+
+import contextlib
+import os
+import re
+import socket
+import tempfile
+import time
+from typing import Dict, List, Optional, Tuple, Union
+
+import attrs
+from invoke.util import debug
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+_metric_sinks: List['MetricSink'] = []
+
+Tags = Dict[str, str]
+_SeriesKey = Tuple[str, Tuple[Tuple[str, str], ...]]
+# metric family -> (comment lines, {sample name and labels: value})
+_Families = Dict[str, Tuple[List[str], Dict[str, Union[int, float]]]]
+
+
+class MetricSink:
+    """
+    Base class for metric sinks.
+
+    Invocate reports two kinds of measurements: counters (``increment``) and
+    durations in seconds (``timing``). Metric names are dotted, e.g.
+    ``task.finished``; tags are a flat ``str -> str`` mapping.
+    """
+
+    def increment(self, name: str, tags: Tags) -> None:
+        """Record a single occurrence of the event ``name``."""
+
+    def timing(self, name: str, seconds: float, tags: Tags) -> None:
+        """Record a duration, in seconds, for the event ``name``."""
+
+    def flush(self) -> None:
+        """Write out anything buffered by the sink."""
+
+
+def add_metric_sink(sink: MetricSink) -> MetricSink:
+    """Attach a metric sink; returns the sink for convenience."""
+    if not any(attached is sink for attached in _metric_sinks):
+        _metric_sinks.append(sink)
+    return sink
+
+
+def remove_metric_sink(sink: MetricSink) -> None:
+    """Detach a previously attached metric sink."""
+    _metric_sinks[:] = [
+        attached for attached in _metric_sinks if attached is not sink]
+
+
+def has_metric_sinks() -> bool:
+    """Return True if any metric sink is attached."""
+    return bool(_metric_sinks)
+
+
+def flush_metric_sinks() -> None:
+    """Flush every attached metric sink."""
+    for sink in _metric_sinks:
+        try:
+            sink.flush()
+        except Exception as e:
+            _sink_failed(sink, e)
+
+
+def emit_increment(name: str, **tags: str) -> None:
+    """Report a counter event to every attached sink."""
+    for sink in _metric_sinks:
+        try:
+            sink.increment(name, tags)
+        except Exception as e:
+            _sink_failed(sink, e)
+
+
+def emit_timing(name: str, seconds: float, **tags: str) -> None:
+    """Report a duration to every attached sink."""
+    for sink in _metric_sinks:
+        try:
+            sink.timing(name, seconds, tags)
+        except Exception as e:
+            _sink_failed(sink, e)
+
+
+def _sink_failed(sink: MetricSink, error: Exception) -> None:
+    # metrics must never take a task run down with them
+    debug('Metric sink {!r} failed: {!r}'.format(sink, error))
+
+
+@contextlib.contextmanager
+def timed(name: str, **tags: str):
+    """Context manager reporting the duration of its body as ``name``."""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        emit_timing(name, time.perf_counter() - start, **tags)
+
+
+@attrs.define(eq=False)
+class StatsdSink(MetricSink):
+    """
+    Send metrics as StatsD datagrams over UDP (localhost by default).
+
+    Tags are appended in the widely supported DogStatsD ``|#key:value``
+    form unless ``use_tags`` is False.
+    """
+    host: str = '127.0.0.1'
+    port: int = 8125
+    prefix: str = 'invocate'
+    use_tags: bool = True
+    _socket: Optional[socket.socket] = attrs.field(default=None, init=False)
+
+    def increment(self, name: str, tags: Tags) -> None:
+        self._send(name, '1|c', tags)
+
+    def timing(self, name: str, seconds: float, tags: Tags) -> None:
+        self._send(name, f'{seconds * 1000:.3f}|ms', tags)
+
+    def _send(self, name: str, value: str, tags: Tags) -> None:
+        line = f'{self.prefix}.{name}:{value}' if self.prefix \
+            else f'{name}:{value}'
+        if self.use_tags and tags:
+            line += '|#' + ','.join(
+                f'{key}:{val}' for key, val in sorted(tags.items()))
+        try:
+            if self._socket is None:
+                self._socket = socket.socket(
+                    socket.AF_INET, socket.SOCK_DGRAM)
+            self._socket.sendto(line.encode(), (self.host, self.port))
+        except OSError:
+            # metrics must never take a task run down with them
+            pass
+
+
+@attrs.define(eq=False)
+class PrometheusTextfileSink(MetricSink):
+    """
+    Accumulate metrics and write them in the Prometheus text format.
+
+    Counters become ``*_total`` series and timings become ``*_seconds``
+    summaries (``_sum``/``_count``). On ``flush`` the accumulated values are
+    added to the series already in the file, under a lock, and the file is
+    replaced atomically. Counters therefore keep rising across runs and
+    across concurrent jobs sharing the file, which makes it suitable for
+    node_exporter's textfile collector.
+    """
+    path: str
+    prefix: str = 'invocate'
+    _counters: Dict[_SeriesKey, int] = attrs.field(factory=dict, init=False)
+    _timings: Dict[_SeriesKey, Tuple[float, int]] = attrs.field(
+        factory=dict, init=False)
+
+    def increment(self, name: str, tags: Tags) -> None:
+        key = (name, tuple(sorted(tags.items())))
+        self._counters[key] = self._counters.get(key, 0) + 1
+
+    def timing(self, name: str, seconds: float, tags: Tags) -> None:
+        key = (name, tuple(sorted(tags.items())))
+        total, count = self._timings.get(key, (0.0, 0))
+        self._timings[key] = (total + seconds, count + 1)
+
+    def flush(self) -> None:
+        if not (self._counters or self._timings):
+            return
+        with _locked(self.path + '.lock'):
+            families = self._read_families()
+            for family, (comments, samples) in self._families().items():
+                merged = families.setdefault(family, (comments, {}))[1]
+                for sample, value in samples.items():
+                    merged[sample] = merged.get(sample, 0) + value
+            self._write(self._render(families))
+        self._counters.clear()
+        self._timings.clear()
+
+    def render(self) -> str:
+        """Return the accumulated metrics in the sink's exposition format."""
+        return self._render(self._families())
+
+    def _families(self) -> _Families:
+        families: _Families = {}
+        for name, series in _group(self._counters).items():
+            metric = self._metric_name(name)
+            family = self._counter_family(metric)
+            families[family] = ([f'# TYPE {family} counter'], {
+                f'{metric}_total{_labels(labels)}': count
+                for labels, count in series})
+        for name, series in _group(self._timings).items():
+            metric = self._metric_name(name) + '_seconds'
+            samples = {}
+            for labels, (total, count) in series:
+                samples[f'{metric}_sum{_labels(labels)}'] = total
+                samples[f'{metric}_count{_labels(labels)}'] = count
+            families[metric] = (self._summary_header(metric), samples)
+        return families
+
+    def _read_families(self) -> _Families:
+        families: _Families = {}
+        family = None
+        try:
+            with open(self.path) as f:
+                lines = f.read().splitlines()
+        except FileNotFoundError:
+            return families
+        for line in lines:
+            if line.startswith('#'):
+                parts = line.split(' ', 3)
+                if len(parts) > 2 and parts[1] in ('TYPE', 'UNIT'):
+                    family = parts[2]
+                    families.setdefault(family, ([], {}))[0].append(line)
+            elif line and family is not None:
+                sample, _, value = line.rpartition(' ')
+                families[family][1][sample] = _number(value)
+        return families
+
+    def _render(self, families: _Families) -> str:
+        lines = []
+        for comments, samples in families.values():
+            lines.extend(comments)
+            for sample, value in samples.items():
+                lines.append(f'{sample} {value!r}')
+        if lines:
+            lines.extend(self._footer())
+        return '\n'.join(lines) + '\n' if lines else ''
+
+    def _write(self, text: str) -> None:
+        directory = os.path.dirname(os.path.abspath(self.path))
+        fd, tmp_path = tempfile.mkstemp(dir=directory, suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'w') as f:
+                f.write(text)
+            # mkstemp creates the file 0600; the collector reading it
+            # usually runs as a different user
+            os.chmod(tmp_path, 0o644)
+            os.replace(tmp_path, self.path)
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.unlink(tmp_path)
+            raise
+
+    def _metric_name(self, name: str) -> str:
+        name = f'{self.prefix}_{name}' if self.prefix else name
+        return re.sub(r'[^a-zA-Z0-9_:]', '_', name)
+
+    def _counter_family(self, metric: str) -> str:
+        return f'{metric}_total'
+
+    def _summary_header(self, metric: str) -> List[str]:
+        return [f'# TYPE {metric} summary']
+
+    def _footer(self) -> List[str]:
+        return []
+
+
+@attrs.define(eq=False)
+class OpenMetricsTextfileSink(PrometheusTextfileSink):
+    """Like `PrometheusTextfileSink`, but writes the OpenMetrics format."""
+
+    def _counter_family(self, metric: str) -> str:
+        return metric
+
+    def _summary_header(self, metric: str) -> List[str]:
+        return [f'# TYPE {metric} summary', f'# UNIT {metric} seconds']
+
+    def _footer(self) -> List[str]:
+        return ['# EOF']
+
+
+@contextlib.contextmanager
+def _locked(path: str):
+    """Hold an exclusive lock on ``path`` where the platform supports it."""
+    with open(path, 'a') as f:
+        if fcntl is not None:
+            fcntl.flock(f, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            if fcntl is not None:
+                fcntl.flock(f, fcntl.LOCK_UN)
+
+
+def _number(text: str) -> Union[int, float]:
+    try:
+        return int(text)
+    except ValueError:
+        return float(text)
+
+
+def _group(values: Dict[_SeriesKey, object]) -> Dict[str, list]:
+    grouped: Dict[str, list] = {}
+    for (name, labels), value in sorted(values.items()):
+        grouped.setdefault(name, []).append((labels, value))
+    return grouped
+
+
+def _labels(labels: Tuple[Tuple[str, str], ...]) -> str:
+    if not labels:
+        return ''
+    escaped = (
+        '{}="{}"'.format(
+            re.sub(r'[^a-zA-Z0-9_]', '_', key),
+            str(val).replace('\\', r'\\').replace('"', r'\"')
+            .replace('\n', r'\n'))
+        for key, val in labels)
+    return '{' + ','.join(escaped) + '}'
@@ -0,0 +1,171 @@
+"""
+A test suite for the cached argument specs and lazily built parser contexts.
+"""
+
+import sys
+
+import pytest
+from invoke import Collection
+
+from invocate import core, task
+from invocate.core import _InvocateInvokeTask
+from invocate.main import InvocateCollection, program
+
+TASKS_MODULE = """
+from invocate import task
+
+@task(help={'who': 'who to greet'})
+def greet(c, who):
+    print('hello', who)
+
+@task(aliases=['other'])
+def not_requested(c, flag=False):
+    print('not requested')
+
+@task(namespace='sub')
+def nested(c):
+    print('nested')
+"""
+
+
+def make_tasks():
+    """Return fresh, unregistered tasks so no test sees another's caches."""
+    def greet(c, who, loud=False):
+        pass
+
+    def not_requested(c, flag=False):
+        pass
+
+    def added_later(c):
+        pass
+
+    return (
+        _InvocateInvokeTask(greet, help={'who': 'who to greet'}),
+        _InvocateInvokeTask(not_requested, aliases=['other']),
+        _InvocateInvokeTask(added_later),
+    )
+
+
+def make_collection():
+    """Return a fresh collection of fresh tasks, plus the tasks themselves."""
+    greet, not_requested, added_later = make_tasks()
+    collection = InvocateCollection()
+    collection.add_task(greet)
+    collection.add_task(not_requested)
+    return collection, greet, not_requested, added_later
+
+
+@pytest.fixture
+def run_program(tmp_path, monkeypatch, capsys):
+    """Run the nv program against TASKS_MODULE, returning its output."""
+    monkeypatch.setattr(core, '_task_collector', None)
+    monkeypatch.setattr(core, '_namespace_tree', None)
+    (tmp_path / 'tasks.py').write_text(TASKS_MODULE)
+
+    def run(*argv):
+        program.run(
+            ['nv', '--search-root', str(tmp_path)] + list(argv), exit=False)
+        return capsys.readouterr().out
+
+    return run
+
+
+# --- define tests
+def test_implicit_positionals():
+    """It should still treat arguments without defaults as positional."""
+    greet = make_tasks()[0]
+    assert greet.positional == ['who']
+
+
+def test_missing_context_argument():
+    """It should reject a task without a context argument when decorated."""
+    with pytest.raises(TypeError):
+        @task
+        def no_context():
+            pass
+
+
+def test_argument_specs_are_cached():
+    """It should build fresh arguments from specs that keep their help."""
+    greet = make_tasks()[0]
+    first = greet.get_arguments()
+    second = greet.get_arguments()
+    assert [arg.names for arg in first] == [arg.names for arg in second]
+    assert first[0] is not second[0]
+    assert second[0].help == 'who to greet'
+    assert second[0].positional
+
+
+def test_contexts_for_named_tasks_only():
+    """It should build parser contexts only for the tasks it is given."""
+    collection, greet, not_requested, _ = make_collection()
+    contexts = collection.to_contexts_for(['greet', '--loud', 'bob'])
+    assert [context.name for context in contexts] == ['greet']
+    assert greet._argument_specs is not None
+    assert not_requested._argument_specs is None
+
+
+def test_contexts_for_aliases():
+    """It should resolve aliases to their primary task's context."""
+    collection, greet, _, _ = make_collection()
+    contexts = collection.to_contexts_for(['other', 'not-requested'])
+    assert [context.name for context in contexts] == ['not-requested']
+    assert contexts[0].aliases == ['other']
+    assert greet._argument_specs is None
+
+
+def test_contexts_for_tasks_added_later():
+    """It should see tasks added after contexts were first requested."""
+    collection, _, _, added_later = make_collection()
+    assert collection.to_contexts_for(['added-later']) == []
+    collection.add_task(added_later)
+    contexts = collection.to_contexts_for(['added-later'])
+    assert [context.name for context in contexts] == ['added-later']
+
+
+def test_contexts_for_changed_subcollections():
+    """It should see tasks added to a subcollection after a first call."""
+    collection, _, _, added_later = make_collection()
+    sub = Collection('sub')
+    collection.add_collection(sub)
+    assert collection.to_contexts_for(['sub.added-later']) == []
+    sub.add_task(added_later)
+    contexts = collection.to_contexts_for(['sub.added-later'])
+    assert [context.name for context in contexts] == ['sub.added-later']
+
+
+def test_program_builds_named_contexts_only(run_program):
+    """It should only introspect the tasks named on the command line."""
+    assert run_program('greet', 'bob') == 'hello bob\n'
+    assert program.collection['greet']._argument_specs is not None
+    assert program.collection['not-requested']._argument_specs is None
+
+
+def test_program_adopts_registered_tasks(run_program):
+    """It should use the registered task objects rather than copies."""
+    run_program('greet', 'bob')
+    tasks_module = sys.modules['tasks']
+    assert program.collection['not-requested'] is tasks_module.not_requested
+    assert program.collection['sub.nested'] is tasks_module.nested
+    assert tasks_module.nested._argument_specs is None
+
+
+def test_program_resolves_aliases(run_program):
+    """It should run a task invoked by its alias."""
+    assert run_program('other', '--flag') == 'not requested\n'
+    assert program.collection['greet']._argument_specs is None
+
+
+def test_program_task_help(run_program):
+    """It should print help for a task given to --help."""
+    output = run_program('--help', 'greet')
+    assert 'who to greet' in output
+    assert program.collection['not-requested']._argument_specs is None
+
+
+def test_program_completion(run_program):
+    """It should build every context when completing."""
+    output = run_program('--complete', '--', 'nv', '')
+    assert 'greet' in output.split()
+    assert 'not-requested' in output.split()
+    assert program.collection['not-requested']._argument_specs is not None
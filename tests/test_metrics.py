@@ -0,0 +1,265 @@
+"""
+A test suite for the instrumentation hooks and metric sinks.
+"""
+
+import os
+import socket
+import stat
+
+import pytest
+from invoke import CommandTimedOut, Context
+
+from invocate import (
+    task, MetricSink, StatsdSink, PrometheusTextfileSink,
+    OpenMetricsTextfileSink, add_metric_sink, remove_metric_sink,
+    flush_metric_sinks)
+from invocate import core, metrics
+from invocate.core import TaskNamespace
+from invocate.main import InvocateConfig, program
+
+
+class RecordingSink(MetricSink):
+    def __init__(self):
+        self.events = []
+        self.flushed = 0
+
+    def increment(self, name, tags):
+        self.events.append(('increment', name, tags))
+
+    def timing(self, name, seconds, tags):
+        self.events.append(('timing', name, tags))
+
+    def flush(self):
+        self.flushed += 1
+
+
+class FailingSink(MetricSink):
+    def increment(self, name, tags):
+        raise RuntimeError('increment')
+
+    def timing(self, name, seconds, tags):
+        raise RuntimeError('timing')
+
+    def flush(self):
+        raise RuntimeError('flush')
+
+
+@pytest.fixture(autouse=True)
+def isolated_registry(monkeypatch):
+    """Keep tasks defined by these tests out of the global task registry."""
+    monkeypatch.setattr(core, '_task_collector', None)
+    monkeypatch.setattr(core, '_namespace_tree', None)
+
+
+@pytest.fixture
+def sink():
+    recorder = add_metric_sink(RecordingSink())
+    yield recorder
+    remove_metric_sink(recorder)
+
+
+# --- define tests
+def test_no_sink_attached():
+    """It should run tasks normally when no sink is attached."""
+    @task(namespace='metrics.quiet')
+    def quiet(c):
+        return 'quiet'
+
+    assert quiet(Context()) == 'quiet'
+
+
+def test_task_registration(sink):
+    """It should report the registration of a task."""
+    @task(namespace='metrics.registered')
+    def registered(c):
+        pass
+
+    assert ('timing', 'task.registered',
+            {'namespace': 'metrics.registered'}) in sink.events
+
+
+def test_task_execution(sink):
+    """It should report the start and end of a task."""
+    @task(name='executed')
+    def executed(c):
+        pass
+
+    @task(name='failed')
+    def failed(c):
+        raise ValueError
+
+    executed(Context())
+    with pytest.raises(ValueError):
+        failed(Context())
+    assert ('increment', 'task.started', {'task': 'executed'}) in sink.events
+    assert ('timing', 'task.finished',
+            {'task': 'executed', 'status': 'ok'}) in sink.events
+    assert ('timing', 'task.finished',
+            {'task': 'failed', 'status': 'error'}) in sink.events
+
+
+def test_namespace_build(sink):
+    """It should report the building of each namespace collection."""
+    root = TaskNamespace()
+    root._seek_or_create('outer')._seek_or_create('inner')
+    root._as_collection()
+    assert ('timing', 'namespace.built',
+            {'namespace': 'outer.inner'}) in sink.events
+    assert ('timing', 'namespace.built', {'namespace': ''}) in sink.events
+
+
+def test_run_spawn_and_exit(sink):
+    """It should report c.run spawns and exits with their exit code."""
+    c = Context(config=InvocateConfig())
+    c.run('exit 3', hide=True, warn=True, in_stream=False)
+    assert ('increment', 'run.spawned', {}) in sink.events
+    assert ('timing', 'run.exited', {'exit_code': '3'}) in sink.events
+
+
+def test_run_asynchronous(sink):
+    """It should report the exit of an asynchronous c.run once joined."""
+    c = Context(config=InvocateConfig())
+    promise = c.run(
+        'exit 2', hide=True, warn=True, in_stream=False, asynchronous=True)
+    assert ('increment', 'run.spawned', {}) in sink.events
+    promise.join()
+    assert ('timing', 'run.exited', {'exit_code': '2'}) in sink.events
+
+
+def test_run_timeout(sink):
+    """It should report the exit code of a c.run that timed out."""
+    c = Context(config=InvocateConfig())
+    with pytest.raises(CommandTimedOut) as e:
+        c.run('sleep 5', hide=True, in_stream=False, timeout=0.2)
+    exit_code = str(e.value.result.exited)
+    assert exit_code != 'None'
+    assert ('timing', 'run.exited', {'exit_code': exit_code}) in sink.events
+
+
+def test_program_run(sink, tmp_path):
+    """It should report the collection load and flush sinks after a run."""
+    (tmp_path / 'tasks.py').write_text(
+        'from invocate import task\n'
+        '\n'
+        '@task\n'
+        'def hello(c):\n'
+        '    pass\n')
+    program.run(
+        ['nv', '--search-root', str(tmp_path), 'hello'], exit=False)
+    assert ('timing', 'collection.loaded', {}) in sink.events
+    assert ('timing', 'task.finished',
+            {'task': 'hello', 'status': 'ok'}) in sink.events
+    assert sink.flushed == 1
+
+
+def test_failing_sink(sink):
+    """It should not let a failing sink break the run or other sinks."""
+    failing = add_metric_sink(FailingSink())
+    try:
+        @task(name='survivor')
+        def survivor(c):
+            return 'survived'
+
+        assert survivor(Context()) == 'survived'
+        flush_metric_sinks()
+    finally:
+        remove_metric_sink(failing)
+    assert ('timing', 'task.finished',
+            {'task': 'survivor', 'status': 'ok'}) in sink.events
+
+
+def test_sink_identity(tmp_path):
+    """It should attach and detach exactly the sink instances given."""
+    first, second = StatsdSink(), StatsdSink()
+    path = str(tmp_path / 'invocate.prom')
+    prom = PrometheusTextfileSink(path=path)
+    try:
+        for attached in (first, second, prom):
+            add_metric_sink(attached)
+        assert metrics._metric_sinks[-3:] == [first, second, prom]
+        remove_metric_sink(PrometheusTextfileSink(path=path))
+        assert any(attached is prom for attached in metrics._metric_sinks)
+        assert len({first, second, prom}) == 3
+    finally:
+        for attached in (first, second, prom):
+            remove_metric_sink(attached)
+    assert not any(
+        attached in (first, second, prom)
+        for attached in metrics._metric_sinks)
+
+
+def test_statsd_sink():
+    """It should send StatsD datagrams over UDP."""
+    server = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    server.bind(('127.0.0.1', 0))
+    server.settimeout(5)
+    statsd = StatsdSink(port=server.getsockname()[1])
+    statsd.increment('task.started', {'task': 'build'})
+    assert server.recv(1024) == b'invocate.task.started:1|c|#task:build'
+    server.close()
+
+
+def test_prometheus_textfile_sink(tmp_path):
+    """It should write counters and summaries in the Prometheus format."""
+    path = tmp_path / 'invocate.prom'
+    prom = PrometheusTextfileSink(path=str(path))
+    prom.increment('task.started', {'task': 'build'})
+    prom.timing('task.finished', 0.5, {'task': 'build'})
+    prom.timing('task.finished', 0.25, {'task': 'build'})
+    prom.flush()
+    assert path.read_text() == (
+        '# TYPE invocate_task_started_total counter\n'
+        'invocate_task_started_total{task="build"} 1\n'
+        '# TYPE invocate_task_finished_seconds summary\n'
+        'invocate_task_finished_seconds_sum{task="build"} 0.75\n'
+        'invocate_task_finished_seconds_count{task="build"} 2\n')
+    assert stat.S_IMODE(os.stat(path).st_mode) == 0o644
+
+
+def test_openmetrics_textfile_sink(tmp_path):
+    """It should write counters and summaries in the OpenMetrics format."""
+    path = tmp_path / 'invocate.om'
+    om = OpenMetricsTextfileSink(path=str(path))
+    om.increment('run.spawned', {})
+    om.flush()
+    assert path.read_text() == (
+        '# TYPE invocate_run_spawned counter\n'
+        'invocate_run_spawned_total 1\n'
+        '# EOF\n')
+
+
+def test_textfile_sinks_merge(tmp_path):
+    """It should add each flush to the series already in the file."""
+    path = tmp_path / 'invocate.prom'
+    for seconds in (0.5, 0.25):
+        prom = PrometheusTextfileSink(path=str(path))
+        prom.increment('task.started', {'task': 'build'})
+        prom.timing('task.finished', seconds, {'task': 'build'})
+        prom.flush()
+    prom = PrometheusTextfileSink(path=str(path))
+    prom.increment('run.spawned', {})
+    prom.flush()
+    prom.flush()
+    assert path.read_text() == (
+        '# TYPE invocate_task_started_total counter\n'
+        'invocate_task_started_total{task="build"} 2\n'
+        '# TYPE invocate_task_finished_seconds summary\n'
+        'invocate_task_finished_seconds_sum{task="build"} 0.75\n'
+        'invocate_task_finished_seconds_count{task="build"} 2\n'
+        '# TYPE invocate_run_spawned_total counter\n'
+        'invocate_run_spawned_total 1\n')
+
+
+def test_openmetrics_textfile_sinks_merge(tmp_path):
+    """It should merge OpenMetrics files and keep a single EOF marker."""
+    path = tmp_path / 'invocate.om'
+    for _ in range(2):
+        om = OpenMetricsTextfileSink(path=str(path))
+        om.timing('run.exited', 1.5, {'exit_code': '0'})
+        om.flush()
+    assert path.read_text() == (
+        '# TYPE invocate_run_exited_seconds summary\n'
+        '# UNIT invocate_run_exited_seconds seconds\n'
+        'invocate_run_exited_seconds_sum{exit_code="0"} 3.0\n'
+        'invocate_run_exited_seconds_count{exit_code="0"} 2\n'
+        '# EOF\n')